@@ -5,6 +5,12 @@ from openpyxl import Workbook
 from datetime import datetime
 from openpyxl.styles import Border, Side, Font, Alignment, numbers
 from openpyxl.utils import get_column_letter
+
+# 预编译正则表达式，避免每次提取时重复解析
+_RE_DATE = re.compile(r"(\d{4}年\d{1,2}月\d{1,2}日)")
+_RE_AMOUNT = re.compile(r"¥\s*(\d+\.\d{2})")
+
+
 def calculate_width(line):
     """
     计算文本行的宽度
@@ -12,13 +18,9 @@ def calculate_width(line):
     :param line: 文本行
     :return: 文本行的宽度
     """
-    width = 0
-    for char in line:
-        if ord(char) > 127:  # 中文字符
-            width += 2
-        else:  # 英文字符
-            width += 1
-    return width
+    # 非 ASCII 字符宽度为 2，ASCII 字符宽度为 1：
+    # 总宽度 = 2 * 字符数 - ASCII 字符数，ASCII 字符数由 C 层的编码器统计
+    return 2 * len(line) - len(line.encode("ascii", "ignore"))
 
 def extract_invoice_data(pdf_path):
     """
@@ -30,7 +32,9 @@ def extract_invoice_data(pdf_path):
     doc = fitz.open(pdf_path)
     # 获取第一页内容（通常发票都是一页）
     page = doc.load_page(0)
-    text = page.get_text()
+    text = page.get_text(
+        "text", flags=fitz.TEXT_MEDIABOX_CLIP | fitz.TEXT_CID_FOR_UNKNOWN_UNICODE
+    )
     print(text)  # 打印提取的文本，方便检查问题
 
     # 按行分割文本
@@ -38,11 +42,8 @@ def extract_invoice_data(pdf_path):
     invoice_number = None
 
     # 提取开票日期
-    issue_date = (
-        re.search(r"(\d{4}年\d{1,2}月\d{1,2}日)", text).group(1)
-        if re.search(r"(\d{4}年\d{1,2}月\d{1,2}日)", text)
-        else None
-    )
+    match = _RE_DATE.search(text)
+    issue_date = match.group(1) if match else None
     # 提取发票号码
     # 从“开票人”关键字开始向下查找，或者从开票日期向上查找
     for i, line in enumerate(lines):
@@ -84,7 +85,7 @@ def extract_invoice_data(pdf_path):
     print(project_name)
 
     # 提取价税合计（小写），根据文本结构调整正则表达式
-    total_amount_matches = re.findall(r"¥\s*(\d+\.\d{2})", text)
+    total_amount_matches = _RE_AMOUNT.findall(text)
     total_amount = total_amount_matches[2] if len(total_amount_matches) > 2 else None
 
     data = {
@@ -2,11 +2,89 @@ import re
 import fitz  # PyMuPDF的导入名称是fitz
 import os
 import sys
+import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
 from datetime import datetime
+from typing import NamedTuple, Optional
 from openpyxl.styles import Border, Side, Font, Alignment, numbers
 from openpyxl.utils import get_column_letter
 
+try:
+    # xlsxwriter 直接生成 XML，写入速度快于 openpyxl；未安装时回退到 openpyxl
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+# 预编译正则表达式，避免每次提取时重复解析
+# 开票日期，允许年份、月份、日期与中文单位之间存在空格
+_RE_DATE = re.compile(r"(\d{4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日")
+# 发票号码，单次扫描同时查找三类候选：
+# e: 全电发票号码（20位数字）
+# p: 带前缀的普通发票/专票号码（8位数字），数字放在先行断言中不消耗，
+#    避免前缀后紧跟的20位号码被截断而漏掉
+# s: 无前缀的8位数字
+_RE_INV = re.compile(
+    r"(?P<e>(?<!\d)\d{20}(?!\d))"
+    r"|(?:发票号码|NO\.?)\s*[:：\s]*(?=(?P<p>\d{8}))"
+    r"|(?P<s>(?<!\d)\d{8}(?!\d))",
+    re.IGNORECASE,
+)
+# 发票号码上下文关键词
+_RE_CTX = re.compile(r"发票|invoice|NO\.", re.IGNORECASE)
+# 金额，同时匹配 ¥ 和 ￥ 符号
+_RE_AMOUNT = re.compile(r"[¥￥]\s*(\d+\.\d{2})")
+
+# 只需要纯文本，不启用任何额外的文本提取选项（与 get_textpage 的默认值 0 相同）；
+# 没有 Unicode 映射的字形输出为 U+FFFD，不会被误识别为数字
+_TEXTPAGE_FLAGS = 0
+
+
+class Invoice(NamedTuple):
+    """
+    发票信息，未提取到的字段为 None
+    """
+
+    number: Optional[str]  # 发票号码
+    date: Optional[str]  # 开票日期
+    project: Optional[str]  # 报销项目
+    amount: Optional[float]  # 价税合计
+
+
+# 发票数据缓存的格式版本，修改提取规则或 Invoice 结构时必须递增，
+# 版本不一致的旧缓存会被整体丢弃，所有 PDF 重新解析
+_CACHE_VERSION = 1
+
+# Excel 表头
+_EXCEL_HEADER = ["文件名", "发票号码", "开票日期", "项目名称", "价税合计（小写）"]
+
+
+def calculate_width(line):
+    """
+    计算文本行的宽度（中文字符宽度为2，英文字符宽度为1）
+
+    :param line: 文本行
+    :return: 文本行的宽度
+    """
+    # 非 ASCII 字符宽度为 2，ASCII 字符宽度为 1：
+    # 总宽度 = 2 * 字符数 - ASCII 字符数，ASCII 字符数由 C 层的编码器统计
+    return 2 * len(line) - len(line.encode("ascii", "ignore"))
+
+
+def calculate_cell_width(value):
+    """
+    计算单元格内容的宽度
+
+    :param value: 单元格的值
+    :return: 单元格内容的宽度
+    """
+    # 只有字符串可能包含中文；数字、None 转换后都是 ASCII，长度即宽度
+    if isinstance(value, str):
+        return calculate_width(value)
+    return len(str(value))
+
 
 def extraction_issue_date(text):
     """
@@ -15,9 +93,11 @@ def extraction_issue_date(text):
     :param text: 文本内容
     :return: 发票日期
     """
-    # 改进的正则表达式，允许年份、月份、日期与中文单位之间存在空格
-    pattern = r"(\d{4})\s*年\s*(\d{1,2})\s*月\s*(\d{1,2})\s*日"
-    match = re.search(pattern, text)
+    # 日期必然包含“年”，先用子串查找快速排除，避免无意义的正则匹配
+    if "年" not in text:
+        return None
+
+    match = _RE_DATE.search(text)
 
     if match:
         # 重新组合日期，去除空格
@@ -34,32 +114,32 @@ def extraction_invoice_number(text):
     :param text: 文本内容
     :return: 发票号码
     """
-    # 1. 尝试匹配全电发票（20位数字）
-    pattern_electronic = r"(?<!\d)\d{20}(?!\d)"
-    match = re.search(pattern_electronic, text)
-    if match:
-        return match.group(0)
-
-    # 2. 尝试匹配普通发票/专票（8位数字）- 改进版
-    # 明确前缀和数字之间的分隔符，如冒号、空格等
-    pattern_normal = r"(?:发票号码|NO\.?)\s*[:：\s]*(\d{8})"
-    match = re.search(pattern_normal, text, re.IGNORECASE)
-    if match:
-        return match.group(1)  # 只返回括号内捕获的数字部分
-
-    # 3. 直接匹配8位数字（无明确前缀时）
-    pattern_standalone = r"(?<!\d)\d{8}(?!\d)"
-    match = re.search(pattern_standalone, text)
-    if match:
-        # 增加上下文验证：检查前后是否有"发票"相关词汇
-        context = text[max(0, match.start() - 20) : min(len(text), match.end() + 20)]
-        if re.search(r"发票|invoice|NO\.", context, re.IGNORECASE):
-            return match.group(0)
+    prefixed = None
+    standalone = None
+    for match in _RE_INV.finditer(text):
+        # 1. 全电发票（20位数字）优先级最高，找到即返回
+        if match.group("e"):
+            return match.group("e")
+        # 2. 普通发票/专票（8位数字），明确前缀和数字之间的分隔符，如冒号、空格等
+        if prefixed is None and match.group("p"):
+            prefixed = match.group("p")  # 只返回括号内捕获的数字部分
+        # 3. 直接匹配8位数字（无明确前缀时），只记录第一个
+        elif standalone is None and match.group("s"):
+            standalone = match
+
+    if prefixed is not None:
+        return prefixed
+
+    if standalone is not None:
+        # 增加上下文验证：检查前后是否有"发票"相关词汇，直接限定搜索范围，无需切片
+        start = max(0, standalone.start() - 20)
+        if _RE_CTX.search(text, start, standalone.end() + 20):
+            return standalone.group(0)
 
     return None
 
 
-def extraction_project_name(text):
+def extraction_project_name(lines):
     """
     提取项目名称
 
@@ -68,38 +148,39 @@ def extraction_project_name(text):
     2. 当前行字符数量（宽度）大于等于22时，继续提取后续行
     3. 后续行不能以*或￥开头
     4. 若当前行字符数量不足22且不以*或￥开头，则结束提取
-    """
-    lines = text.split("\n")
-
-    def calculate_width(line):
-        """计算文本行的宽度（中文字符宽度为2，英文字符宽度为1）"""
-        return sum(2 if ord(char) > 127 else 1 for char in line)
 
+    :param lines: 按行分割后的文本内容
+    :return: 项目名称
+    """
     project_name_parts = []
+    append = project_name_parts.append  # 局部别名，避免循环内的属性查找
     in_project_section = False
 
     for line in lines:
+        # 空行或只含空白的行：不在项目部分时直接跳过，在项目部分时宽度为 0，结束提取
+        # 不能在提取前统一过滤掉空行，否则项目名称后的空行无法再作为结束标志
+        if not line or line.isspace():
+            if in_project_section:
+                break
+            continue
+
         line = line.strip()
-        line_width = calculate_width(line)
+        first = line[:1]
 
         # 如果不在项目部分，寻找起始行（以*开头）
         if not in_project_section:
-            if line.startswith("*"):
+            if first == "*":
                 in_project_section = True
-                project_name_parts.append(line)
+                append(line)
+            continue
 
-        # 如果已在项目部分，处理后续行
-        else:
-            # 若当前行以*或￥开头，结束提取
-            if line.startswith(("*", "¥")):
-                break
-
-            # 若当前行宽度不足22，结束提取
-            if line_width < 22:
-                break
+        # 如果已在项目部分，若当前行以*或￥开头，或宽度不足22，结束提取
+        # 宽度只在前两个条件不满足时才计算
+        if first == "*" or first == "¥" or calculate_width(line) < 22:
+            break
 
-            # 符合条件的行，添加到项目名称
-            project_name_parts.append(line)
+        # 符合条件的行，添加到项目名称
+        append(line)
 
     return " ".join(project_name_parts)
 
@@ -111,8 +192,12 @@ def extraction_amount(text):
     :param text: 文本内容
     :return: 金额
     """
+    # 金额必然包含货币符号，先用子串查找快速排除
+    if "¥" not in text and "￥" not in text:
+        return None
+
     # 同时匹配 ¥ 和 ￥ 符号，忽略符号后的空格
-    total_amount_matches = re.findall(r"[¥￥]\s*(\d+\.\d{2})", text)
+    total_amount_matches = _RE_AMOUNT.findall(text)
 
     # 处理匹配结果
     if not total_amount_matches:
@@ -137,39 +222,41 @@ def extract_invoice_data(pdf_path):
     从 PDF 文件中提取发票信息
 
     :param pdf_path: PDF 文件路径
-    :return: 包含发票信息的字典
+    :return: 发票信息
     """
     try:
-        # 打开 PDF 文件（自动处理文件路径和异常）
-        with fitz.open(pdf_path) as doc:
-            # 检查 PDF 是否有至少一页
-            if doc.page_count < 1:
-                raise ValueError("PDF 无内容或页数不足")
-
-            # 获取第一页（索引从 0 开始）
-            page = doc[0]  # 替代 load_page(0)
-            text = page.get_textpage().extractText()
-
-            # print(text)
-
-            # 提取开票日期
-            issue_date = extraction_issue_date(text)
-            # 提取发票号码
-            invoice_number = extraction_invoice_number(text)
-            # 提取项目名称
-            project_name = extraction_project_name(text)
-            # 提取价税合计（小写）
-            total_amount = extraction_amount(text)
-
-            # 将提取的信息存入字典
-            data = {
-                "发票号码": invoice_number,
-                "开票日期": issue_date,
-                "报销项目": project_name,
-                "价税合计": total_amount,
-            }
-
-            return data
+        # 打开 PDF 文件（自动处理文件路径和异常），指定文件类型以跳过格式探测
+        with fitz.open(filename=pdf_path, filetype="pdf") as doc:
+            # 获取第一页（索引从 0 开始），PDF 没有页面时抛出 IndexError
+            try:
+                page = doc[0]  # 替代 load_page(0)
+            except IndexError:
+                raise ValueError("PDF 无内容或页数不足") from None
+            textpage = page.get_textpage(flags=_TEXTPAGE_FLAGS)
+            text = textpage.extractText()
+            textpage = None  # 尽早释放 TextPage
+
+        # 文本已取出，文档已关闭，以下只处理字符串
+        # 只分割一次，供需要逐行处理的提取函数使用
+        lines = text.split("\n")
+
+        # print(text)
+
+        # 提取开票日期
+        issue_date = extraction_issue_date(text)
+        # 提取发票号码
+        invoice_number = extraction_invoice_number(text)
+        # 提取项目名称
+        project_name = extraction_project_name(lines)
+        # 提取价税合计（小写）
+        total_amount = extraction_amount(text)
+
+        return Invoice(
+            number=invoice_number,
+            date=issue_date,
+            project=project_name,
+            amount=total_amount,
+        )
 
     except FileNotFoundError:
         print(f"错误：文件 {pdf_path} 未找到")
@@ -182,21 +269,92 @@ def extract_invoice_data(pdf_path):
         raise  # 重新抛出异常
 
 
-def traverse_pdf_files(document_dir):
+def load_invoice_cache(cache_path):
+    """
+    读取发票数据缓存
+
+    :param cache_path: 缓存文件路径
+    :return: 缓存字典，键为 (文件绝对路径, 修改时间, 文件大小)，值为发票信息
+    """
+    if cache_path is None or not os.path.exists(cache_path):
+        return {}
+    try:
+        with open(cache_path, "rb") as f:
+            cache = pickle.load(f)
+    except Exception as e:
+        # 缓存损坏或版本不兼容时忽略，重新解析全部文件
+        print(f"读取缓存 {cache_path} 失败，将重新解析所有文件: {e}")
+        return {}
+    # 缓存格式为 {"version": 版本号, "entries": {...}}，版本不一致时丢弃
+    if not isinstance(cache, dict) or cache.get("version") != _CACHE_VERSION:
+        return {}
+    entries = cache.get("entries")
+    return entries if isinstance(entries, dict) else {}
+
+
+def save_invoice_cache(cache, cache_path):
     """
-    遍历指定目录下的所有 PDF 文件
+    保存发票数据缓存
+
+    :param cache: 缓存字典
+    :param cache_path: 缓存文件路径
+    """
+    if cache_path is None:
+        return
+    try:
+        with open(cache_path, "wb") as f:
+            pickle.dump(
+                {"version": _CACHE_VERSION, "entries": cache},
+                f,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+    except OSError as e:
+        # 缓存只用于加速，写入失败不影响本次导出
+        print(f"保存缓存 {cache_path} 失败: {e}")
+
+
+def traverse_pdf_files(document_dir, cache_path=None):
+    """
+    遍历指定目录下的所有 PDF 文件，按目录顺序逐个产出提取结果
+
+    结果以生成器的形式返回，调用方可以边解析边写入，无需先缓存全部结果。
+    文件路径、修改时间和大小均未变化的 PDF 直接使用缓存中的结果，不再重新解析。
 
     :param document_dir: 文件目录
-    :return: 包含所有 PDF 文件名列表
+    :param cache_path: 缓存文件路径，为 None 时不使用缓存
+    :return: 生成 (文件名, 发票信息) 元组的迭代器
     """
-    pdf_data = []
-    for filename in os.listdir(document_dir):
-        if filename.endswith(".pdf"):
-            pdf_path = os.path.join(document_dir, filename)
+    # os.scandir 返回的 DirEntry 自带完整路径和文件类型，无需再拼接路径
+    with os.scandir(document_dir) as it:
+        entries = [
+            entry for entry in it if entry.is_file() and entry.name.endswith(".pdf")
+        ]
+    filenames = [entry.name for entry in entries]
+    pdf_paths = [entry.path for entry in entries]
+    cache_keys = []
+    for entry in entries:
+        st = entry.stat()
+        cache_keys.append((os.path.abspath(entry.path), st.st_mtime_ns, st.st_size))
+
+    cache = load_invoice_cache(cache_path)
+    # 只保留本次目录中仍存在的文件，避免缓存无限增长
+    new_cache = {}
+
+    # PDF 文本提取是 CPU 密集型任务，各文件之间互不依赖，使用多进程并行处理
+    # 不使用 with：退出 with 时会等待所有已提交的任务完成，出错时应立即返回
+    pool = ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 4))
+    try:
+        # 命中缓存的文件不提交任务；map 按提交顺序返回结果，
+        # 取出一个结果后即释放对应的 Future，不会在内存中堆积
+        results = pool.map(
+            extract_invoice_data,
+            [p for p, key in zip(pdf_paths, cache_keys) if key not in cache],
+        )
+        for filename, pdf_path, key in zip(filenames, pdf_paths, cache_keys):
             try:
                 # 尝试提取发票数据
-                invoice_data = extract_invoice_data(pdf_path)
-                pdf_data.append((filename, invoice_data))
+                invoice_data = cache[key] if key in cache else next(results)
+                new_cache[key] = invoice_data
             except FileNotFoundError as e:
                 # 处理文件不存在异常
                 print(f"错误：文件 {pdf_path} 不存在")
@@ -209,69 +367,152 @@ def traverse_pdf_files(document_dir):
                 # 处理其他未知异常
                 print(f"错误：处理文件 {pdf_path} 时发生异常: {str(e)}")
                 raise
-    return pdf_data
+            yield filename, invoice_data
+    except BaseException:
+        # 出错或生成器被提前关闭（GeneratorExit）时，取消尚未开始的任务，
+        # 不等待剩余文件全部解析完毕
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+    save_invoice_cache(new_cache, cache_path)
 
 
 def write_to_excel(pdf_data, excel_path):
     """
     将提取的发票信息写入 Excel 文件
 
-    :param pdf_data: 包含发票信息的列表
+    优先使用 xlsxwriter，未安装时使用 openpyxl。
+
+    :param pdf_data: 生成 (文件名, 发票信息) 元组的可迭代对象
+    :param excel_path: Excel 文件路径
+    """
+    if xlsxwriter is not None:
+        write_to_excel_xlsxwriter(pdf_data, excel_path)
+    else:
+        write_to_excel_openpyxl(pdf_data, excel_path)
+
+
+def write_to_excel_xlsxwriter(pdf_data, excel_path):
+    """
+    使用 xlsxwriter 将提取的发票信息写入 Excel 文件
+
+    :param pdf_data: 生成 (文件名, 发票信息) 元组的可迭代对象
+    :param excel_path: Excel 文件路径
+    """
+    # 先写入同目录下的临时文件，全部成功后再替换为目标文件，
+    # 避免出错时留下只写入了部分数据的 Excel 文件
+    tmp_path = excel_path + ".tmp"
+    # constant_memory 模式下每写完一行就刷新到临时文件，内存占用不随行数增长
+    wb = xlsxwriter.Workbook(tmp_path, {"constant_memory": True})
+    try:
+        ws = wb.add_worksheet()
+        header = _EXCEL_HEADER
+
+        # 格式对象只创建一次：框线，表头加粗且居中
+        cell_format = wb.add_format({"border": 1})
+        header_format = wb.add_format({"border": 1, "bold": True, "align": "center"})
+
+        # 计算字符宽度，中文字符宽度乘以 2
+        col_widths = [calculate_width(h) for h in header]
+        ws.write_row(0, 0, header, header_format)
+
+        # 单次遍历：逐行写入并统计每列最大宽度
+        for row_index, (filename, inv) in enumerate(pdf_data, start=1):
+            row = (filename, inv.number, inv.date, inv.project, inv.amount)
+            for i, value in enumerate(row):
+                length = calculate_cell_width(value)
+                if length > col_widths[i]:
+                    col_widths[i] = length
+            ws.write_row(row_index, 0, row, cell_format)
+
+        # 适应列宽，xlsxwriter 在关闭时才输出列信息，可以在写入数据后设置
+        for i, max_length in enumerate(col_widths):
+            ws.set_column(i, i, max_length + 2)
+    except BaseException:
+        # 出错时也要关闭工作簿，释放 constant_memory 使用的临时文件和句柄；
+        # close 自身的异常不能覆盖原始异常，临时输出文件无论如何都要删除
+        try:
+            wb.close()
+        except Exception:
+            pass
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        raise
+
+    # 成功时 close 的异常正常抛出
+    wb.close()
+    os.replace(tmp_path, excel_path)
+
+
+def write_to_excel_openpyxl(pdf_data, excel_path):
+    """
+    使用 openpyxl 将提取的发票信息写入 Excel 文件
+
+    :param pdf_data: 生成 (文件名, 发票信息) 元组的可迭代对象
     :param excel_path: Excel 文件路径
     """
-    # openpyxl 使用的是“写入时构建”的方法，
-    # 即在你调用 ws.append() 方法时，数据会被直接写入到内存中的一个数据结构中，而不是整个Excel文件。
-    # 如果后期数据量过大，可以考虑使用 openpyxl 的优化方法。如 write_only 模式。
-    wb = Workbook()
+    # 使用 openpyxl 的 write_only 模式，样式在创建单元格时一并设置，
+    # 无需写入后再遍历工作表。
+    # write_only 模式必须在写入第一行之前设置列宽，因此先把各行的值缓存为元组、
+    # 统计列宽，再逐行创建带样式的单元格写入。
+    wb = Workbook(write_only=True)
     if wb is None:
         raise RuntimeError("无法创建 Excel 工作簿")
 
-    # 获取活动工作表（默认存在）
-    ws = wb.active
+    # write_only 模式下没有默认的活动工作表，需要手动创建
+    ws = wb.create_sheet()
     if ws is None:
         raise RuntimeError("无法获取工作表")
-    header = ["文件名", "发票号码", "开票日期", "项目名称", "价税合计（小写）"]
-    ws.append(header)
+    header = _EXCEL_HEADER
 
-    # 设置表头样式：加粗且居中
-    header_font = Font(bold=True)
-    header_alignment = Alignment(horizontal="center")
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.alignment = header_alignment
-
-    for filename, invoice_data in pdf_data:
-        row = [filename] + list(invoice_data.values())
-        ws.append(row)
-
-    # 适应列宽
-    for column in ws.columns:
-        max_length = 0
-        # 确保column[0].column不是None
-        if column[0].column is not None:
-            column_letter = get_column_letter(column[0].column)
-            for cell in column:
-                try:
-                    cell_value = str(cell.value)
-                    # 计算字符宽度，中文字符宽度乘以 2
-                    length = sum(2 if ord(c) > 127 else 1 for c in cell_value)
-                    if length > max_length:
-                        max_length = length
-                except:
-                    pass
-            adjusted_width = max_length + 2
-            ws.column_dimensions[column_letter].width = adjusted_width
-
-    # 添加框线
+    # 框线
     thin_border = Border(
         left=Side(style="thin"),
         right=Side(style="thin"),
         top=Side(style="thin"),
         bottom=Side(style="thin"),
     )
-    for row in ws.iter_rows():
-        for cell in row:
+
+    # 计算字符宽度，中文字符宽度乘以 2
+    col_widths = [calculate_width(h) for h in header]
+
+    # 单次遍历：缓存每行的值并统计每列最大宽度，只保存值元组，不提前创建单元格
+    data_rows = []
+    for filename, inv in pdf_data:
+        row = (filename, inv.number, inv.date, inv.project, inv.amount)
+        for i, value in enumerate(row):
+            length = calculate_cell_width(value)
+            if length > col_widths[i]:
+                col_widths[i] = length
+        data_rows.append(row)
+
+    # 适应列宽
+    # write_only 模式在写入第一行时就会输出列宽信息，因此必须在 append 之前设置
+    for i, max_length in enumerate(col_widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = max_length + 2
+
+    # 设置表头样式：加粗且居中
+    header_font = Font(bold=True)
+    header_alignment = Alignment(horizontal="center")
+    header_cells = []
+    for value in header:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.font = header_font
+        cell.alignment = header_alignment
+        cell.border = thin_border
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    # 写入时才创建带框线的单元格，写完一行即可释放
+    for row in data_rows:
+        row_cells = []
+        for value in row:
+            cell = WriteOnlyCell(ws, value=value)
             cell.border = thin_border
+            row_cells.append(cell)
+        ws.append(row_cells)
 
     wb.save(excel_path)
 
@@ -311,7 +552,10 @@ def main():
             os.makedirs(data_dir)
         # 构建 Excel 文件路径 实时时间中不包含秒，短时间内重复运行可能会导致文件名重复
         excel_path = os.path.join(data_dir, f"{formatted_time}导出发票信息.xlsx")
-        pdf_data = traverse_pdf_files(document_dir)
+        # 发票数据缓存，再次运行时未变化的 PDF 无需重新解析
+        cache_path = os.path.join(data_dir, ".invoice_cache.pkl")
+        # 边解析边写入，不在内存中缓存全部提取结果
+        pdf_data = traverse_pdf_files(document_dir, cache_path)
         write_to_excel(pdf_data, excel_path)
         print(f"发票信息已保存到 {excel_path}")
     except Exception as e:
@@ -320,6 +564,8 @@ def main():
 
 
 if __name__ == "__main__":
+    # 打包为 exe 后，多进程子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
     main()
     # resource_path("document")
     # path = "document/7.功放模块 8.2.pdf"